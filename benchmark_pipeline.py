@@ -0,0 +1,134 @@
+import os
+import sys
+import tempfile
+
+# Compares steady-state throughput of one worker node in the task-per-image model
+# (WORKER_PROCESSES processes each running process_image in sequence) with the
+# pipelined model (one process running run_pipeline with PIPELINE_FETCH_CONCURRENCY
+# fetchers and PIPELINE_ENCODE_PROCESSES encode processes). WORKER_PROCESSES
+# defaults to PIPELINE_FETCH_CONCURRENCY so both models have the same number of
+# downloads in flight. Images are served locally with BENCH_LATENCY seconds of
+# simulated network latency per request.
+#
+#   python benchmark_pipeline.py [images]
+
+_workdir = tempfile.mkdtemp(prefix='pipeline_bench_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_workdir, 'bench.db')}")
+os.environ.setdefault('PROCESSED_FOLDER', os.path.join(_workdir, 'processed'))
+os.environ.setdefault('RESULTS_FOLDER', os.path.join(_workdir, 'results'))
+
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import BytesIO
+from multiprocessing import Pool
+from config import Config
+from database.models import Request, Product, Image, db
+from runtime import app_context
+
+LATENCY = float(os.environ.get('BENCH_LATENCY', 0.15))
+WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', Config.PIPELINE_FETCH_CONCURRENCY))
+IMAGE_VARIANTS = 8
+
+def create_images():
+    """
+    Creates noisy high-quality JPEGs that are expensive to re-encode.
+    """
+    from PIL import Image as PILImage
+    
+    images = []
+    for i in range(IMAGE_VARIANTS):
+        noise = PILImage.effect_noise((1600, 1200), 40 + i * 5)
+        img = PILImage.merge('RGB', (noise, noise.rotate(90, expand=False), noise.transpose(PILImage.FLIP_LEFT_RIGHT)))
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=92)
+        images.append(output.getvalue())
+    
+    return images
+
+def start_image_server(images):
+    """
+    Serves /<n>.jpg from memory after LATENCY seconds.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(LATENCY)
+            body = images[int(self.path.strip('/').split('.')[0]) % len(images)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def create_request(base_url, count):
+    """
+    Creates a request with `count` pending images and returns the image IDs.
+    """
+    with app_context():
+        request_id = str(uuid.uuid4())
+        db.session.add(Request(id=request_id, status='processing', total_images=count))
+        product = Product(request_id=request_id, serial_number=1, product_name='bench')
+        db.session.add(product)
+        db.session.flush()
+        
+        images = [Image(product_id=product.id, input_url=f"{base_url}/{i}.jpg", status='pending') for i in range(count)]
+        db.session.add_all(images)
+        db.session.commit()
+        
+        return [image.id for image in images]
+
+def _process_images(image_ids):
+    from services.image_processor import process_image
+    
+    for image_id in image_ids:
+        process_image(image_id)
+
+def run_task_model(image_ids):
+    """
+    Runs process_image for every image on WORKER_PROCESSES processes, as a prefork worker would.
+    """
+    shares = [image_ids[i::WORKER_PROCESSES] for i in range(WORKER_PROCESSES)]
+    
+    started = time.monotonic()
+    with Pool(WORKER_PROCESSES) as pool:
+        pool.map(_process_images, shares)
+    
+    return time.monotonic() - started
+
+def run_pipeline_model(image_ids):
+    """
+    Runs the staged pipeline over every image in this process.
+    """
+    from services.pipeline import get_encode_pool, run_pipeline
+    
+    # Start the encode processes outside the measurement
+    list(get_encode_pool().map(abs, range(Config.PIPELINE_ENCODE_PROCESSES)))
+    
+    return run_pipeline(image_ids)['elapsed']
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    
+    with app_context():
+        db.create_all()
+    
+    base_url = start_image_server(create_images())
+    
+    task_elapsed = run_task_model(create_request(base_url, count))
+    pipeline_elapsed = run_pipeline_model(create_request(base_url, count))
+    
+    print(f"{count} images, {LATENCY:.2f}s latency, {os.cpu_count()} CPUs")
+    print(f"task-per-image ({WORKER_PROCESSES} processes): {task_elapsed:.2f}s, {count / task_elapsed:.1f} images/s")
+    print(
+        f"pipeline ({Config.PIPELINE_FETCH_CONCURRENCY} fetchers, {Config.PIPELINE_ENCODE_PROCESSES} encoders): "
+        f"{pipeline_elapsed:.2f}s, {count / pipeline_elapsed:.1f} images/s"
+    )
@@ -10,16 +10,22 @@ class Config:
     # Database configuration
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 2))  # per process
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # seconds
     
     # Redis configuration
     REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
     REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD', None)
     REDIS_DB = int(os.environ.get('REDIS_DB', 0))
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 4))  # per process
+    REDIS_POOL_TIMEOUT = int(os.environ.get('REDIS_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
     
     # Celery configuration
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}')
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}')
+    CELERY_BROKER_POOL_LIMIT = int(os.environ.get('CELERY_BROKER_POOL_LIMIT', 4))  # per process
     
     # File storage configuration
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', './uploads')
@@ -32,5 +38,36 @@ class Config:
     # Job configuration
     JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 300))  # 5 minutes
     
+    # Upload validation configuration
+    URL_ALLOWED_SCHEMES = os.environ.get('URL_ALLOWED_SCHEMES', 'http,https').split(',')
+    URL_PROBE_ENABLED = os.environ.get('URL_PROBE_ENABLED', 'False') == 'True'
+    URL_PROBE_CONCURRENCY = int(os.environ.get('URL_PROBE_CONCURRENCY', 32))
+    URL_PROBE_PER_HOST = int(os.environ.get('URL_PROBE_PER_HOST', 4))
+    URL_PROBE_TIMEOUT = int(os.environ.get('URL_PROBE_TIMEOUT', 5))
+    URL_PROBE_DEADLINE = int(os.environ.get('URL_PROBE_DEADLINE', 20))  # seconds for the whole upload
+    
+    # Pipeline configuration (process_request_images hands chunks of images to process_image_batch)
+    PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'False') == 'True'
+    PIPELINE_CHUNK_SIZE = int(os.environ.get('PIPELINE_CHUNK_SIZE', 200))  # images per task
+    PIPELINE_FETCH_CONCURRENCY = int(os.environ.get('PIPELINE_FETCH_CONCURRENCY', 16))
+    PIPELINE_ENCODE_PROCESSES = int(os.environ.get('PIPELINE_ENCODE_PROCESSES', os.cpu_count() or 1))
+    PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 32))  # images buffered between stages
+    PIPELINE_COMMIT_BATCH = int(os.environ.get('PIPELINE_COMMIT_BATCH', 50))
+    PIPELINE_COMMIT_INTERVAL = float(os.environ.get('PIPELINE_COMMIT_INTERVAL', 1.0))  # max seconds a partial batch waits
+    
+    # Compression configuration
+    COMPRESSION_QUALITY = int(os.environ.get('COMPRESSION_QUALITY', 50))
+    COMPRESSION_MIN_SAVINGS = float(os.environ.get('COMPRESSION_MIN_SAVINGS', 10))  # percent
+    
     # Webhook configuration
-    WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
\ No newline at end of file
+    WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+    WEBHOOK_TIMEOUT = int(os.environ.get('WEBHOOK_TIMEOUT', 10))
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 4))
+    WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 50))  # max events coalesced into one POST
+    WEBHOOK_BATCH_WINDOW = int(os.environ.get('WEBHOOK_BATCH_WINDOW', 5))  # seconds to wait for more events
+    WEBHOOK_FLUSH_LIMIT = int(os.environ.get('WEBHOOK_FLUSH_LIMIT', 500))  # max outbox rows claimed per flush
+    WEBHOOK_CLAIM_TIMEOUT = int(os.environ.get('WEBHOOK_CLAIM_TIMEOUT', 300))  # reclaim rows stuck in 'sending'
+    WEBHOOK_SWEEP_INTERVAL = int(os.environ.get('WEBHOOK_SWEEP_INTERVAL', 60))  # seconds between periodic outbox flushes
+    WEBHOOK_POOL_SIZE = int(os.environ.get('WEBHOOK_POOL_SIZE', 20))  # pooled connections per endpoint
+    WEBHOOK_MAX_WORKERS = int(os.environ.get('WEBHOOK_MAX_WORKERS', 8))
+    WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT = int(os.environ.get('WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT', 2))
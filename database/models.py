@@ -15,9 +15,10 @@ class Request(db.Model):
     total_images = db.Column(db.Integer, default=0)
     processed_images = db.Column(db.Integer, default=0)
     webhook_url = db.Column(db.String(255), nullable=True)
-    webhook_status = db.Column(db.String(20), nullable=True)  # not_sent, sent, failed
+    webhook_status = db.Column(db.String(20), nullable=True)  # not_sent, queued, sent, failed
     
     products = db.relationship('Product', backref='request', lazy=True, cascade="all, delete-orphan")
+    webhook_deliveries = db.relationship('WebhookDelivery', backref='request', lazy=True, cascade="all, delete-orphan")
 
 class Product(db.Model):
     """Represents a product from the CSV file."""
@@ -41,5 +42,25 @@ class Image(db.Model):
     input_url = db.Column(db.String(1024), nullable=False)
     output_url = db.Column(db.String(1024), nullable=True)
     status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed
+    source_quality = db.Column(db.Integer, nullable=True)  # estimated from JPEG quantization tables
+    compression_decision = db.Column(db.String(20), nullable=True)  # recompressed, skipped, passthrough
+    claim_token = db.Column(db.String(36), nullable=True, index=True)  # set when a pipeline run claims the image
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class WebhookDelivery(db.Model):
+    """Durable outbox entry for a completion webhook awaiting delivery."""
+    __tablename__ = 'webhook_outbox'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    request_id = db.Column(db.String(36), db.ForeignKey('requests.id'), nullable=False)
+    webhook_url = db.Column(db.String(255), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON event, built once when the request completes
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    claim_token = db.Column(db.String(36), nullable=True, index=True)
+    last_error = db.Column(db.String(1024), nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
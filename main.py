@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import request, jsonify
 import uuid
 import os
 from werkzeug.utils import secure_filename
@@ -6,10 +6,10 @@ from services.validation import validate_csv
 from services.queue_manager import enqueue_processing_task
 from database.models import Request, db
 from config import Config
+from runtime import get_app
 
-app = Flask(__name__)
-app.config.from_object(Config)
-db.init_app(app)
+# The web process shares the runtime's app, so workers and routes use one engine pool
+app = get_app()
 
 # Ensure upload directory exists
 os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
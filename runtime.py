@@ -0,0 +1,131 @@
+from celery import Celery
+from celery.signals import worker_process_init
+from config import Config
+import threading
+from contextlib import nullcontext
+
+# Process-wide runtime shared by the web app, the Celery worker and the RQ worker.
+# The Flask app, database engine and Redis client are created on first use, so
+# importing task modules stays cheap and forked worker processes each get their own.
+
+celery = Celery(
+    'image_processor',
+    broker=Config.CELERY_BROKER_URL,
+    include=['services.image_processor', 'services.webhook_service']
+)
+celery.conf.broker_pool_limit = Config.CELERY_BROKER_POOL_LIMIT
+
+# Sweep the webhook outbox periodically so entries whose flush was never scheduled
+# (lost publish) or whose flusher died while sending are still delivered
+celery.conf.beat_schedule = {
+    'flush-webhook-outbox': {
+        'task': 'services.webhook_service.flush_webhook_outbox',
+        'schedule': Config.WEBHOOK_SWEEP_INTERVAL
+    }
+}
+
+_app = None
+_redis = None
+_lock = threading.Lock()
+
+def get_engine_options(database_uri):
+    """
+    Returns the SQLAlchemy engine options for the configured database.
+    
+    Parameters:
+    database_uri (str): The database URI
+    
+    Returns:
+    dict: Engine options; SQLite keeps SQLAlchemy's defaults as it does not use a QueuePool
+    """
+    if database_uri.startswith('sqlite'):
+        return {}
+    
+    return {
+        'pool_size': Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_recycle': Config.DB_POOL_RECYCLE,
+        'pool_pre_ping': True
+    }
+
+def get_app():
+    """
+    Returns the process-wide Flask app, creating it and binding the database on first use.
+    
+    Returns:
+    Flask: The Flask application
+    """
+    global _app
+    
+    if _app is None:
+        with _lock:
+            if _app is None:
+                from flask import Flask
+                from database.models import db
+                
+                app = Flask(__name__)
+                app.config.from_object(Config)
+                app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(Config.SQLALCHEMY_DATABASE_URI)
+                db.init_app(app)
+                _app = app
+    
+    return _app
+
+def app_context():
+    """
+    Returns an application context for code that runs outside a web request.
+    If one is already active it is reused: pushing and popping a nested context
+    removes the session, detaching the objects the caller is still working with.
+    
+    Returns:
+    AppContext: The context of the process-wide Flask app, or a no-op context
+    when one is already active
+    """
+    from flask import has_app_context
+    
+    if has_app_context():
+        return nullcontext()
+    
+    return get_app().app_context()
+
+def get_redis():
+    """
+    Returns the process-wide Redis client. When all pooled connections are in use,
+    callers wait up to REDIS_POOL_TIMEOUT seconds instead of opening more.
+    
+    Returns:
+    redis.Redis: The Redis client
+    """
+    global _redis
+    
+    if _redis is None:
+        with _lock:
+            if _redis is None:
+                import redis
+                
+                pool = redis.BlockingConnectionPool(
+                    host=Config.REDIS_HOST,
+                    port=Config.REDIS_PORT,
+                    password=Config.REDIS_PASSWORD,
+                    db=Config.REDIS_DB,
+                    max_connections=Config.REDIS_MAX_CONNECTIONS,
+                    timeout=Config.REDIS_POOL_TIMEOUT
+                )
+                _redis = redis.Redis(connection_pool=pool)
+    
+    return _redis
+
+@worker_process_init.connect
+def reset_connections(**kwargs):
+    """
+    Drops connections inherited from the parent when Celery forks a worker process.
+    """
+    global _redis
+    
+    if _app is not None:
+        from database.models import db
+        
+        with _app.app_context():
+            db.engine.dispose()
+    
+    _redis = None
@@ -0,0 +1,113 @@
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Standard IJG luminance quantization table (JPEG spec, Annex K), which libjpeg
+# and most encoders scale by the quality setting
+STANDARD_LUMINANCE_TABLE = [
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99
+]
+
+# Formats Pillow reports for baseline JPEG files; many cameras write MPO, which is a
+# JPEG with extra frames appended
+JPEG_FORMATS = ('JPEG', 'MPO')
+
+# Scale at which every table entry is clamped to 1 (quality 100)
+MIN_TABLE_SCALE = 64 * 100.0 / sum(STANDARD_LUMINANCE_TABLE)
+
+# Encoded size grows roughly as scale ** -0.55 across the usual quality range
+SIZE_SCALE_EXPONENT = 0.55
+
+def quality_to_scale(quality):
+    """
+    Converts an IJG quality setting into the percentage the standard tables are scaled by.
+    
+    Parameters:
+    quality (int): JPEG quality (1-100)
+    
+    Returns:
+    float: The table scale factor in percent
+    """
+    quality = min(max(quality, 1), 100)
+    return 5000.0 / quality if quality < 50 else 200.0 - 2 * quality
+
+def scale_to_quality(scale):
+    """
+    Converts a table scale factor back into the equivalent IJG quality setting.
+    
+    Parameters:
+    scale (float): The table scale factor in percent
+    
+    Returns:
+    int: JPEG quality (1-100)
+    """
+    quality = (200.0 - scale) / 2 if scale <= 100 else 5000.0 / scale
+    return int(round(min(max(quality, 1), 100)))
+
+def estimate_table_scale(img):
+    """
+    Estimates how much the luminance quantization table of a JPEG is scaled
+    relative to the standard table. Only the header is read; the image is not decoded.
+    
+    Parameters:
+    img (PIL.Image.Image): An opened (not loaded) image
+    
+    Returns:
+    float: The estimated scale factor in percent, or None if the image is not a JPEG
+    """
+    tables = getattr(img, 'quantization', None)
+    
+    if img.format not in JPEG_FORMATS or not tables:
+        return None
+    
+    # Table 0 is the luminance table; the sum is independent of zigzag ordering
+    luminance = tables.get(0) or next(iter(tables.values()))
+    
+    return sum(luminance) * 100.0 / sum(STANDARD_LUMINANCE_TABLE)
+
+def precheck_recompression(img, target_quality, min_savings_percent):
+    """
+    Decides, from the JPEG header alone, whether re-encoding at the target quality
+    is expected to save at least the configured percentage.
+    
+    Parameters:
+    img (PIL.Image.Image): An opened (not loaded) image
+    target_quality (int): Quality the image would be re-encoded at
+    min_savings_percent (float): Minimum expected size reduction worth re-encoding for
+    
+    Returns:
+    dict: 'recompress' boolean, 'source_quality' (None for non-JPEG) and 'estimated_savings' percent
+    """
+    result = {
+        'recompress': True,
+        'source_quality': None,
+        'estimated_savings': None
+    }
+    
+    try:
+        source_scale = estimate_table_scale(img)
+    except Exception as e:
+        logger.warning(f"Could not read quantization tables: {str(e)}")
+        return result
+    
+    # Non-JPEG images have no quantization tables to go by
+    if source_scale is None:
+        return result
+    
+    target_scale = max(quality_to_scale(target_quality), MIN_TABLE_SCALE)
+    estimated_savings = (1 - (source_scale / target_scale) ** SIZE_SCALE_EXPONENT) * 100
+    
+    result['source_quality'] = scale_to_quality(source_scale)
+    result['estimated_savings'] = estimated_savings
+    result['recompress'] = estimated_savings >= min_savings_percent
+    
+    return result
@@ -1,24 +1,18 @@
-from PIL import Image as PILImage
-import requests
 from io import BytesIO
 import os
 import uuid
-from celery import Celery
+from datetime import datetime
 from config import Config
-from database.models import Request, Image, db
-from services.webhook_service import send_completion_webhook
+from database.models import Request, Product, Image, db
+from runtime import celery, app_context
+from services.compression_precheck import JPEG_FORMATS, precheck_recompression
+from services.webhook_service import enqueue_completion_webhook, schedule_webhook_flush
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Celery
-celery = Celery(
-    'image_processor',
-    broker=f'redis://{Config.REDIS_HOST}:{Config.REDIS_PORT}/{Config.REDIS_DB}'
-)
-
 @celery.task
 def process_request_images(request_id):
     """
@@ -27,9 +21,7 @@ def process_request_images(request_id):
     Parameters:
     request_id (str): The ID of the request
     """
-    from flask import current_app
-    
-    with current_app.app_context():
+    with app_context():
         # Get all images for this request
         images = Image.query.join(
             Image.product
@@ -38,6 +30,13 @@ def process_request_images(request_id):
             Image.status == 'pending'
         ).all()
         
+        # In pipeline mode each worker processes a chunk of images with overlapping stages
+        if Config.PIPELINE_MODE:
+            image_ids = [image.id for image in images]
+            for start in range(0, len(image_ids), Config.PIPELINE_CHUNK_SIZE):
+                process_image_batch.delay(image_ids[start:start + Config.PIPELINE_CHUNK_SIZE])
+            return
+        
         # Process each image
         for image in images:
             process_image.delay(image.id)
@@ -50,9 +49,9 @@ def process_image(image_id):
     Parameters:
     image_id (str): The ID of the image to process
     """
-    from flask import current_app
+    import requests
     
-    with current_app.app_context():
+    with app_context():
         # Get the image record
         image = Image.query.get(image_id)
         
@@ -69,31 +68,13 @@ def process_image(image_id):
             response = requests.get(image.input_url, timeout=30)
             response.raise_for_status()
             
-            # Open the image with PIL
-            img = PILImage.open(BytesIO(response.content))
-            
-            # Process the image (compress by 50% quality)
-            output = BytesIO()
-            img.save(output, format=img.format, quality=50)
-            output.seek(0)
-            
-            # Generate a unique filename
-            filename = f"{uuid.uuid4()}.{img.format.lower() if img.format else 'jpg'}"
-            output_path = os.path.join(Config.PROCESSED_FOLDER, filename)
-            
-            # Ensure the directory exists
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            # Save to disk
-            with open(output_path, 'wb') as f:
-                f.write(output.read())
-            
-            # In a real application, you would upload to S3 or similar
-            # For this example, we'll just create a URL based on local path
-            output_url = f"{Config.BASE_URL}/processed/{filename}"
+            # Process the image, skipping recompression where it would not help
+            result = compress_image_bytes(response.content)
             
             # Update the image record
-            image.output_url = output_url
+            image.output_url = save_processed_image(result)
+            image.source_quality = result['source_quality']
+            image.compression_decision = result['decision']
             image.status = 'completed'
             db.session.commit()
             
@@ -106,6 +87,97 @@ def process_image(image_id):
             db.session.commit()
             check_request_completion(image.product.request_id)
 
+@celery.task
+def process_image_batch(image_ids):
+    """
+    Process a batch of images in this worker with the staged pipeline.
+    
+    Parameters:
+    image_ids (list): The IDs of the images to process
+    """
+    from services.pipeline import run_pipeline
+    
+    run_pipeline(image_ids)
+
+def save_processed_image(result):
+    """
+    Writes a processed image to the processed folder.
+    
+    Parameters:
+    result (dict): The result of compress_image_bytes
+    
+    Returns:
+    str: URL of the processed image
+    """
+    # Generate a unique filename
+    filename = f"{uuid.uuid4()}.{result['extension']}"
+    output_path = os.path.join(Config.PROCESSED_FOLDER, filename)
+    
+    # Ensure the directory exists
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    # Save to disk
+    with open(output_path, 'wb') as f:
+        f.write(result['data'])
+    
+    # In a real application, you would upload to S3 or similar
+    # For this example, we'll just create a URL based on local path
+    return f"{Config.BASE_URL}/processed/{filename}"
+
+def compress_image_bytes(content, quality=None, min_savings=None):
+    """
+    Compresses an encoded image. JPEGs whose quantization tables show that
+    re-encoding would not save at least `min_savings` percent are skipped without
+    being decoded, and re-encoded output that turns out no smaller is discarded.
+    
+    Parameters:
+    content (bytes): The encoded source image
+    quality (int): Target quality (defaults to COMPRESSION_QUALITY)
+    min_savings (float): Minimum size reduction in percent (defaults to COMPRESSION_MIN_SAVINGS)
+    
+    Returns:
+    dict: 'data' bytes, file 'extension', estimated 'source_quality' and the 'decision'
+    (recompressed, skipped or passthrough)
+    """
+    from PIL import Image as PILImage
+    
+    if quality is None:
+        quality = Config.COMPRESSION_QUALITY
+    if min_savings is None:
+        min_savings = Config.COMPRESSION_MIN_SAVINGS
+    
+    # Opening only parses the header; pixels are decoded on save
+    img = PILImage.open(BytesIO(content))
+    precheck = precheck_recompression(img, quality, min_savings)
+    
+    # Camera JPEGs reported as MPO are re-encoded and served as plain JPEGs
+    output_format = 'JPEG' if img.format in JPEG_FORMATS else img.format
+    
+    result = {
+        'data': content,
+        'extension': output_format.lower() if output_format else 'jpg',
+        'source_quality': precheck['source_quality'],
+        'decision': 'skipped'
+    }
+    
+    if not precheck['recompress']:
+        return result
+    
+    # Process the image (compress to the target quality)
+    output = BytesIO()
+    img.save(output, format=output_format, quality=quality)
+    data = output.getvalue()
+    
+    # Keep the original if re-encoding did not save enough
+    if len(data) > len(content) * (1 - min_savings / 100):
+        result['decision'] = 'passthrough'
+        return result
+    
+    result['data'] = data
+    result['decision'] = 'recompressed'
+    
+    return result
+
 def check_request_completion(request_id):
     """
     Check if all images for a request have been processed.
@@ -114,9 +186,7 @@ def check_request_completion(request_id):
     Parameters:
     request_id (str): The ID of the request
     """
-    from flask import current_app
-    
-    with current_app.app_context():
+    with app_context():
         # Get the request
         request = Request.query.get(request_id)
         
@@ -145,10 +215,16 @@ def check_request_completion(request_id):
         # Check if all images are processed
         if processed_count == total_count:
             request.status = 'completed'
-            db.session.commit()
+            request.updated_at = datetime.utcnow()
             
-            # If webhook is configured, trigger it
+            # If webhook is configured, record it in the outbox together with the status change;
+            # this only adds a row, the results CSV is built when the outbox is flushed
+            delivery = None
             if request.webhook_url and request.webhook_status == 'not_sent':
-                send_completion_webhook.delay(request_id)
+                delivery = enqueue_completion_webhook(request)
+            db.session.commit()
+            
+            if delivery:
+                schedule_webhook_flush()
         else:
             db.session.commit()
\ No newline at end of file
@@ -0,0 +1,357 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+from database.models import Product, Image, db
+from runtime import app_context
+from services.image_processor import compress_image_bytes, save_processed_image, check_request_completion
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Encode pool reused across pipeline runs in this worker process
+_encode_pool = None
+_encode_pool_lock = threading.Lock()
+
+# Marks the end of a stage's input
+_DONE = object()
+
+def get_encode_pool():
+    """
+    Returns the pool used by the encode stage, creating it on first use.
+    Encode processes are spawned rather than forked so they never inherit the
+    worker's database or Redis connections. Daemonic processes, such as Celery's
+    prefork children, cannot start processes, so there the encode stage runs on threads.
+    
+    Returns:
+    Executor: The encode pool
+    """
+    global _encode_pool
+    
+    if _encode_pool is None:
+        with _encode_pool_lock:
+            if _encode_pool is None:
+                if multiprocessing.current_process().daemon:
+                    logger.warning(
+                        "Daemonic worker process cannot start encoder processes, encoding on threads; "
+                        "run the worker with --pool solo to encode on processes"
+                    )
+                    _encode_pool = ThreadPoolExecutor(max_workers=Config.PIPELINE_ENCODE_PROCESSES)
+                else:
+                    _encode_pool = ProcessPoolExecutor(
+                        max_workers=Config.PIPELINE_ENCODE_PROCESSES,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+    
+    return _encode_pool
+
+def reset_encode_pool(pool):
+    """
+    Discards a broken encode pool so the next call to get_encode_pool creates a new one.
+    
+    Parameters:
+    pool (Executor): The pool that broke
+    """
+    global _encode_pool
+    
+    with _encode_pool_lock:
+        if _encode_pool is pool:
+            _encode_pool = None
+    
+    pool.shutdown(wait=False)
+
+def run_pipeline(image_ids):
+    """
+    Processes images with the download, encode and write stages running concurrently.
+    Downloads run on PIPELINE_FETCH_CONCURRENCY threads, encoding on
+    PIPELINE_ENCODE_PROCESSES processes, and results are written and committed in
+    batches of up to PIPELINE_COMMIT_BATCH images, or after PIPELINE_COMMIT_INTERVAL
+    seconds for a partial batch. At most PIPELINE_QUEUE_SIZE images are
+    buffered between stages, so a slow stage holds back the ones before it.
+    
+    Parameters:
+    image_ids (list): The IDs of the images to process
+    
+    Returns:
+    dict: Number of 'images' processed, 'failed' images, 'elapsed' seconds and 'throughput' in images per second
+    """
+    # Set up the encode stage before claiming so a pool that cannot start fails no images
+    get_encode_pool()
+    
+    with app_context():
+        images = claim_images(image_ids)
+        
+        if not images:
+            logger.warning("No pending images to process")
+            return {'images': 0, 'failed': 0, 'elapsed': 0.0, 'throughput': 0.0}
+        
+        started = time.monotonic()
+        committed = set()
+        try:
+            failed = asyncio.run(_run_stages(images, committed))
+        except Exception:
+            # Do not leave the claimed images stuck in 'processing'
+            fail_uncommitted_images(images, committed)
+            raise
+        elapsed = time.monotonic() - started
+    
+    stats = {
+        'images': len(images),
+        'failed': failed,
+        'elapsed': elapsed,
+        'throughput': len(images) / elapsed if elapsed > 0 else 0.0
+    }
+    logger.info(
+        f"Pipeline processed {stats['images']} images ({stats['failed']} failed) "
+        f"in {stats['elapsed']:.2f}s, {stats['throughput']:.1f} images/s"
+    )
+    
+    return stats
+
+def claim_images(image_ids):
+    """
+    Atomically marks the pending images among the given IDs as processing.
+    
+    Parameters:
+    image_ids (list): The IDs of the images to process
+    
+    Returns:
+    list: A dict with 'id', 'input_url' and 'request_id' for every image claimed by this call
+    """
+    # Conditional update so a redelivered chunk never processes images claimed elsewhere
+    claim_token = str(uuid.uuid4())
+    Image.query.filter(
+        Image.id.in_(image_ids),
+        Image.status == 'pending'
+    ).update({
+        'status': 'processing',
+        'claim_token': claim_token
+    }, synchronize_session=False)
+    db.session.commit()
+    
+    rows = Image.query.join(
+        Image.product
+    ).with_entities(
+        Image.id, Image.input_url, Product.request_id
+    ).filter(
+        Image.claim_token == claim_token,
+        Image.status == 'processing'
+    ).all()
+    
+    return [{'id': row.id, 'input_url': row.input_url, 'request_id': row.request_id} for row in rows]
+
+def _create_download_session():
+    """
+    Returns a requests session pooled for the fetch stage's concurrency.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=Config.PIPELINE_FETCH_CONCURRENCY,
+        pool_maxsize=Config.PIPELINE_FETCH_CONCURRENCY
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    
+    return session
+
+def _download(session, url):
+    """
+    Downloads an image for the fetch stage.
+    """
+    response = session.get(url, timeout=30)
+    response.raise_for_status()
+    
+    return response.content
+
+async def _run_stages(images, committed):
+    """
+    Runs the fetch, encode and write stages for run_pipeline until every image is written.
+    The IDs of images whose results have been committed are added to `committed`.
+    
+    Returns:
+    int: The number of images that failed
+    """
+    loop = asyncio.get_running_loop()
+    session = _create_download_session()
+    fetch_executor = ThreadPoolExecutor(max_workers=Config.PIPELINE_FETCH_CONCURRENCY)
+    db_executor = ThreadPoolExecutor(max_workers=1)
+    
+    fetch_queue = asyncio.Queue()
+    for image in images:
+        fetch_queue.put_nowait(image)
+    
+    # Bounded queues between stages provide backpressure
+    encode_queue = asyncio.Queue(maxsize=Config.PIPELINE_QUEUE_SIZE)
+    write_queue = asyncio.Queue(maxsize=Config.PIPELINE_QUEUE_SIZE)
+    failed = 0
+    
+    async def fetch():
+        while not fetch_queue.empty():
+            image = fetch_queue.get_nowait()
+            try:
+                content = await loop.run_in_executor(fetch_executor, _download, session, image['input_url'])
+            except Exception as e:
+                await write_queue.put((image, None, e))
+                continue
+            await encode_queue.put((image, content))
+    
+    async def encode():
+        while True:
+            item = await encode_queue.get()
+            if item is _DONE:
+                return
+            image, content = item
+            result, error = None, None
+            
+            # If an encoder process dies (e.g. OOM-killed) the pool is unusable;
+            # replace it and retry the image once on the new pool
+            for attempt in range(2):
+                pool = get_encode_pool()
+                try:
+                    result = await loop.run_in_executor(pool, compress_image_bytes, content)
+                    error = None
+                    break
+                except BrokenProcessPool as e:
+                    logger.error(f"Encode pool broke while processing image {image['id']}: {str(e)}")
+                    reset_encode_pool(pool)
+                    error = e
+                except Exception as e:
+                    error = e
+                    break
+            
+            await write_queue.put((image, result, error))
+    
+    async def write():
+        nonlocal failed
+        batch = []
+        deadline = None
+        
+        while True:
+            # Wait for the next image, but no longer than the open batch may stay uncommitted
+            timeout = max(0.0, deadline - loop.time()) if batch else None
+            try:
+                item = await asyncio.wait_for(write_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await flush(batch)
+                batch = []
+                continue
+            
+            if item is _DONE:
+                break
+            
+            image, result, error = item
+            if error is None:
+                try:
+                    output_url = await loop.run_in_executor(None, save_processed_image, result)
+                except Exception as e:
+                    error = e
+            
+            # Only what is stored on the image is kept, not the encoded data
+            if error is not None:
+                logger.error(f"Error processing image {image['id']}: {str(error)}")
+                failed += 1
+                batch.append((image, None, None, None))
+            else:
+                batch.append((image, output_url, result['source_quality'], result['decision']))
+            
+            # Commit when the batch is full or PIPELINE_COMMIT_INTERVAL after its first image
+            if len(batch) == 1:
+                deadline = loop.time() + Config.PIPELINE_COMMIT_INTERVAL
+            if len(batch) >= Config.PIPELINE_COMMIT_BATCH:
+                await flush(batch)
+                batch = []
+        
+        if batch:
+            await flush(batch)
+    
+    async def flush(batch):
+        # Database work runs on its own thread so it never stalls the other stages
+        await loop.run_in_executor(db_executor, commit_batch, batch)
+        committed.update(image['id'] for image, *_ in batch)
+    
+    async def feed():
+        await asyncio.gather(*[fetch() for _ in range(Config.PIPELINE_FETCH_CONCURRENCY)])
+        for _ in range(Config.PIPELINE_ENCODE_PROCESSES):
+            await encode_queue.put(_DONE)
+        await asyncio.gather(*encoders)
+        await write_queue.put(_DONE)
+    
+    encoders = [asyncio.ensure_future(encode()) for _ in range(Config.PIPELINE_ENCODE_PROCESSES)]
+    
+    try:
+        await asyncio.gather(feed(), write())
+    finally:
+        fetch_executor.shutdown(wait=False)
+        db_executor.shutdown(wait=True)
+        session.close()
+    
+    return failed
+
+def fail_uncommitted_images(images, committed):
+    """
+    Marks claimed images whose results were never committed as failed after the
+    pipeline stopped with an error, and checks their requests for completion.
+    Errors here are logged so they do not hide the one that stopped the pipeline.
+    
+    Parameters:
+    images (list): The images claimed by run_pipeline
+    committed (set): The IDs of the images whose results were committed
+    """
+    remaining = [image for image in images if image['id'] not in committed]
+    
+    if not remaining:
+        return
+    
+    try:
+        db.session.rollback()
+        Image.query.filter(
+            Image.id.in_([image['id'] for image in remaining]),
+            Image.status == 'processing'
+        ).update({'status': 'failed'}, synchronize_session=False)
+        db.session.commit()
+        
+        for request_id in {image['request_id'] for image in remaining}:
+            check_request_completion(request_id)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error marking {len(remaining)} unfinished images as failed: {str(e)}")
+
+def commit_batch(batch):
+    """
+    Records a batch of processed images in one commit and checks their requests for completion.
+    Runs on the write stage's database thread, which has its own app context and session.
+    
+    Parameters:
+    batch (list): (image, output_url, source_quality, decision) tuples; output_url is None for failed images
+    """
+    with app_context():
+        records = {
+            record.id: record for record in Image.query.filter(
+                Image.id.in_([image['id'] for image, *_ in batch])
+            ).all()
+        }
+        
+        for image, output_url, source_quality, decision in batch:
+            record = records[image['id']]
+            if output_url is None:
+                record.status = 'failed'
+                continue
+            record.output_url = output_url
+            record.source_quality = source_quality
+            record.compression_decision = decision
+            record.status = 'completed'
+        
+        db.session.commit()
+        
+        # Check each affected request once per batch
+        for request_id in {image['request_id'] for image, *_ in batch}:
+            check_request_completion(request_id)
@@ -1,19 +1,16 @@
-import redis
-import json
 from config import Config
-from rq import Queue
-from worker import process_image
+from runtime import get_redis, app_context
 
-# Connect to Redis
-redis_conn = redis.Redis(
-    host=Config.REDIS_HOST,
-    port=Config.REDIS_PORT,
-    password=Config.REDIS_PASSWORD,
-    db=Config.REDIS_DB
-)
-
-# Create a queue
-queue = Queue(connection=redis_conn)
+def get_queue():
+    """
+    Returns the RQ queue, backed by the shared Redis client.
+    
+    Returns:
+    rq.Queue: The default queue
+    """
+    from rq import Queue
+    
+    return Queue(connection=get_redis())
 
 def enqueue_processing_task(request_id, filepath):
     """
@@ -25,11 +22,9 @@ def enqueue_processing_task(request_id, filepath):
     """
     from services.validation import process_csv_to_db
     from services.image_processor import process_request_images
-    from services.webhook_service import send_completion_webhook
     from database.models import Request, db
-    from flask import current_app
     
-    with current_app.app_context():
+    with app_context():
         # First, process the CSV into the database
         process_csv_to_db(request_id, filepath)
         
@@ -48,8 +43,10 @@ def enqueue_image_task(image_id):
     Parameters:
     image_id (str): The ID of the image to process
     """
+    from worker import process_image
+    
     # Add the job to the queue
-    job = queue.enqueue(
+    job = get_queue().enqueue(
         process_image,
         image_id,
         job_timeout=Config.JOB_TIMEOUT
@@ -1,6 +1,182 @@
+import asyncio
 import pandas as pd
 import requests
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote, urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+from config import Config
 from database.models import Product, Image, db
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# scheme://host[:port][/path][?query][#fragment]. The authority must end at '/', '?',
+# '#' or the end of the URL, and '@' is not allowed in it, so user info is rejected
+URL_PATTERN = (
+    r'^(?P<scheme>[A-Za-z][A-Za-z0-9+.\-]*)://'
+    r'(?P<host>[A-Za-z0-9\-._~%]+|\[[0-9A-Fa-f:.]+\])'
+    r'(?::(?P<port>\d{1,5}))?'
+    r'(?P<path>/[^?#\s]*)?'
+    r'(?P<query>\?[^#\s]*)?'
+    r'(?:#\S*)?$'
+)
+
+# Characters left unquoted when encoding a URL path (RFC 3986 pchar and '/'),
+# matching what requests sends; '%' is kept so encoded URLs are not encoded twice
+URL_PATH_SAFE = "/%:@!$&'()*+,;=~"
+
+def encode_url(url):
+    """
+    Encodes a URL the way requests would before sending it: a non-ASCII host is
+    IDNA-encoded and spaces and non-ASCII characters are percent-quoted.
+    URLs that cannot be encoded are returned unchanged.
+    
+    Parameters:
+    url (str): The URL as written in the CSV
+    
+    Returns:
+    str: The encoded URL
+    """
+    try:
+        parts = urlsplit(url)
+        netloc = parts.netloc
+        
+        # User info is left in place so the URL is still rejected
+        if not netloc.isascii() and '@' not in netloc:
+            host, _, port = netloc.partition(':')
+            netloc = host.encode('idna').decode('ascii') + (f":{port}" if port else '')
+        
+        return urlunsplit((
+            parts.scheme,
+            netloc,
+            quote(parts.path, safe=URL_PATH_SAFE),
+            quote(parts.query, safe=URL_PATH_SAFE + '?'),
+            quote(parts.fragment, safe=URL_PATH_SAFE + '?')
+        ))
+    except (ValueError, UnicodeError):
+        return url
+
+def parse_image_urls(url_column):
+    """
+    Splits, normalizes and deduplicates the image URLs of every row at once.
+    
+    Parameters:
+    url_column (pandas.Series): The 'Input Image Urls' column
+    
+    Returns:
+    pandas.DataFrame: One row per URL, indexed by the CSV row index, with the
+    'original' and normalized 'url' strings and a 'valid' flag
+    """
+    urls = url_column.dropna().astype(str).str.split(',').explode().str.strip()
+    urls = urls[urls != '']
+    
+    # Only URLs with spaces or non-ASCII characters need encoding
+    needs_encoding = urls.str.contains(r'[^\x21-\x7e]')
+    encoded = urls.copy()
+    encoded[needs_encoding] = urls[needs_encoding].map(encode_url).to_numpy()
+    
+    parts = encoded.str.extract(URL_PATTERN)
+    scheme = parts['scheme'].str.lower()
+    host = parts['host'].str.lower()
+    
+    # Drop default ports
+    port = parts['port'].fillna('')
+    port = port.mask((scheme == 'http') & (port == '80'), '').mask((scheme == 'https') & (port == '443'), '')
+    port = port.mask(port != '', ':' + port)
+    
+    path = parts['path'].fillna('').replace('', '/')
+    
+    valid = scheme.isin([s.strip().lower() for s in Config.URL_ALLOWED_SCHEMES]) & host.notna()
+    valid &= port.str[1:].replace('', '0').astype(int) <= 65535
+    
+    normalized = scheme + '://' + host + port + path + parts['query'].fillna('')
+    
+    parsed = pd.DataFrame({
+        'original': urls,
+        'url': normalized.where(valid, urls),
+        'valid': valid
+    })
+    
+    # The same image listed twice for one product is only processed once
+    parsed = parsed[~parsed.set_index('url', append=True).index.duplicated()]
+    
+    return parsed
+
+def probe_image_urls(urls):
+    """
+    Checks that image URLs are reachable with concurrent HEAD requests, bounded
+    globally by URL_PROBE_CONCURRENCY, per host by URL_PROBE_PER_HOST and in total
+    time by URL_PROBE_DEADLINE. URLs not probed before the deadline are not reported.
+    
+    Parameters:
+    urls (list): Normalized image URLs
+    
+    Returns:
+    dict: Error message for every URL that could not be reached
+    """
+    if not urls:
+        return {}
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=Config.URL_PROBE_CONCURRENCY, pool_maxsize=Config.URL_PROBE_PER_HOST)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    
+    executor = ThreadPoolExecutor(max_workers=Config.URL_PROBE_CONCURRENCY)
+    
+    try:
+        return asyncio.run(_probe_all(urls, session, executor))
+    finally:
+        # Requests still running after the deadline keep using the session, so it is
+        # closed in the background once they finish instead of under them
+        executor.shutdown(wait=False, cancel_futures=True)
+        threading.Thread(target=_close_when_idle, args=(executor, session), daemon=True).start()
+
+def _close_when_idle(executor, session):
+    """
+    Closes the probe session once the executor's in-flight requests have finished.
+    """
+    executor.shutdown(wait=True)
+    session.close()
+
+async def _probe_all(urls, session, executor):
+    """
+    Runs the HEAD probes for probe_image_urls on the given executor.
+    """
+    loop = asyncio.get_running_loop()
+    global_slots = asyncio.Semaphore(Config.URL_PROBE_CONCURRENCY)
+    host_slots = defaultdict(lambda: asyncio.Semaphore(Config.URL_PROBE_PER_HOST))
+    errors = {}
+    
+    async def probe(url):
+        # Wait for a host slot first so a busy host does not hold global slots
+        async with host_slots[urlsplit(url).netloc]:
+            async with global_slots:
+                try:
+                    response = await loop.run_in_executor(
+                        executor,
+                        partial(session.head, url, timeout=Config.URL_PROBE_TIMEOUT, allow_redirects=True)
+                    )
+                    # Some servers do not implement HEAD
+                    if response.status_code >= 400 and response.status_code != 405:
+                        errors[url] = f"returned HTTP {response.status_code}"
+                except requests.RequestException as e:
+                    errors[url] = str(e)
+    
+    tasks = [asyncio.ensure_future(probe(url)) for url in urls]
+    done, pending = await asyncio.wait(tasks, timeout=Config.URL_PROBE_DEADLINE)
+    
+    if pending:
+        logger.warning(f"URL probe deadline reached, {len(pending)} of {len(urls)} URLs not checked")
+        for task in pending:
+            task.cancel()
+    
+    return errors
 
 def validate_csv(filepath):
     """
@@ -31,47 +207,42 @@ def validate_csv(filepath):
             result['errors'].append(f"Missing required columns: {', '.join(missing_columns)}")
             return result
         
-        # Validate each row
-        total_images = 0
-        for index, row in df.iterrows():
-            # Check for empty values
-            if pd.isna(row['S. No.']) or pd.isna(row['Product Name']) or pd.isna(row['Input Image Urls']):
-                result['valid'] = False
-                result['errors'].append(f"Row {index+1} has empty required fields")
-                continue
-            
-            # Validate serial number is an integer
-            try:
-                int(row['S. No.'])
-            except:
-                result['valid'] = False
-                result['errors'].append(f"Row {index+1} has invalid serial number")
-                continue
-            
-            # Validate image URLs
-            image_urls = [url.strip() for url in str(row['Input Image Urls']).split(',')]
-            if not image_urls:
-                result['valid'] = False
-                result['errors'].append(f"Row {index+1} has no image URLs")
-                continue
-            
-            total_images += len(image_urls)
+        # Check for empty values
+        row_errors = defaultdict(list)
+        empty = df[required_columns].isna().any(axis=1)
+        for index in df.index[empty]:
+            row_errors[index].append(f"Row {index+1} has empty required fields")
+        
+        # Validate serial number is an integer
+        invalid_serial = ~empty & pd.to_numeric(df['S. No.'], errors='coerce').isna()
+        for index in df.index[invalid_serial]:
+            row_errors[index].append(f"Row {index+1} has invalid serial number")
+        
+        # Validate image URLs
+        checked = ~(empty | invalid_serial)
+        urls = parse_image_urls(df.loc[checked, 'Input Image Urls'])
+        
+        for index in df.index[checked & ~df.index.isin(urls.index)]:
+            row_errors[index].append(f"Row {index+1} has no image URLs")
+        
+        for index, url in urls.loc[~urls['valid'], 'original'].items():
+            row_errors[index].append(f"Row {index+1} has invalid image URL: {url}")
+        
+        # Optional: Check if URLs are accessible
+        if Config.URL_PROBE_ENABLED:
+            valid_urls = urls.loc[urls['valid'], 'url']
+            probe_errors = probe_image_urls(valid_urls.unique().tolist())
             
-            # Optional: Check if URLs are accessible (commented out to avoid actual network requests during validation)
-            """
-            for url in image_urls:
-                try:
-                    response = requests.head(url, timeout=5)
-                    if response.status_code != 200:
-                        result['valid'] = False
-                        result['errors'].append(f"Row {index+1} has inaccessible image URL: {url}")
-                except:
-                    result['valid'] = False
-                    result['errors'].append(f"Row {index+1} has invalid image URL: {url}")
-            """
+            for index, url in valid_urls[valid_urls.isin(list(probe_errors))].items():
+                row_errors[index].append(f"Row {index+1} has inaccessible image URL: {url} ({probe_errors[url]})")
         
-        result['total_images'] = total_images
+        if row_errors:
+            result['valid'] = False
+            for index in sorted(row_errors):
+                result['errors'].extend(row_errors[index])
         
+        result['total_images'] = int(urls['valid'].sum())
+    
     except Exception as e:
         result['valid'] = False
         result['errors'].append(f"Error reading CSV file: {str(e)}")
@@ -90,8 +261,12 @@ def process_csv_to_db(request_id, filepath):
         # Read the CSV file
         df = pd.read_csv(filepath)
         
+        # Normalize and deduplicate the image URLs of all rows up front
+        urls = parse_image_urls(df['Input Image Urls'])
+        urls_by_row = urls.loc[urls['valid'], 'url'].groupby(level=0).apply(list)
+        
         # Process each row
-        for _, row in df.iterrows():
+        for index, row in df.iterrows():
             # Create product
             product = Product(
                 request_id=request_id,
@@ -103,18 +278,16 @@ def process_csv_to_db(request_id, filepath):
             db.session.flush()  # Get the product ID
             
             # Create images
-            image_urls = [url.strip() for url in str(row['Input Image Urls']).split(',')]
-            for url in image_urls:
-                if url:  # Skip empty URLs
-                    image = Image(
-                        product_id=product.id,
-                        input_url=url,
-                        status='pending'
-                    )
-                    db.session.add(image)
+            for url in urls_by_row.get(index, []):
+                image = Image(
+                    product_id=product.id,
+                    input_url=url,
+                    status='pending'
+                )
+                db.session.add(image)
         
         db.session.commit()
-        
+    
     except Exception as e:
         db.session.rollback()
-        raise e
\ No newline at end of file
+        raise e
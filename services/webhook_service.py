@@ -1,33 +1,80 @@
-import requests
 import json
 import hmac
 import hashlib
-from celery import Celery
+import os
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
 from config import Config
-from database.models import Request, Product, Image, db
+from database.models import Request, Product, Image, WebhookDelivery, db
+from runtime import celery, app_context
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Celery
-celery = Celery(
-    'webhook_service',
-    broker=f'redis://{Config.REDIS_HOST}:{Config.REDIS_PORT}/{Config.REDIS_DB}'
-)
+# Shared HTTP session and per-endpoint concurrency slots, created lazily per process
+_session = None
+_session_lock = threading.Lock()
+_endpoint_slots = {}
+_endpoint_slots_lock = threading.Lock()
 
-@celery.task(bind=True, max_retries=3)
-def send_completion_webhook(self, request_id):
+def get_http_session():
     """
-    Sends a webhook notification when all images for a request have been processed.
+    Returns the process-wide pooled HTTP session used for webhook delivery.
+    
+    Returns:
+    requests.Session: Session with keep-alive connection pools per endpoint
+    """
+    global _session
+    
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=Config.WEBHOOK_POOL_SIZE,
+                    pool_maxsize=Config.WEBHOOK_POOL_SIZE
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    
+    return _session
+
+def _endpoint_slot(webhook_url):
+    """
+    Returns the semaphore limiting concurrent deliveries to the host of a webhook URL.
     
     Parameters:
-    request_id (str): The ID of the request
+    webhook_url (str): The webhook URL
+    
+    Returns:
+    threading.BoundedSemaphore: The semaphore for the endpoint
+    """
+    endpoint = urlsplit(webhook_url).netloc.lower()
+    
+    with _endpoint_slots_lock:
+        if endpoint not in _endpoint_slots:
+            _endpoint_slots[endpoint] = threading.BoundedSemaphore(Config.WEBHOOK_MAX_CONCURRENCY_PER_ENDPOINT)
+        return _endpoint_slots[endpoint]
+
+@celery.task
+def send_completion_webhook(request_id):
     """
-    from flask import current_app
+    Queues the completion webhook for a request and schedules an outbox flush.
     
-    with current_app.app_context():
+    Parameters:
+    request_id (str): The ID of the request
+    """
+    with app_context():
         # Get the request
         request = Request.query.get(request_id)
         
@@ -35,61 +82,276 @@ def send_completion_webhook(self, request_id):
             logger.warning(f"Request {request_id} not found or has no webhook URL")
             return
         
-        try:
-            # Generate the CSV with results
-            csv_url = generate_results_csv(request_id)
-            
-            # Prepare webhook payload
-            payload = {
-                'request_id': request_id,
-                'status': request.status,
-                'total_images': request.total_images,
-                'processed_images': request.processed_images,
-                'completion_time': request.updated_at.isoformat(),
-                'results_csv_url': csv_url
-            }
-            
-            # Sign the payload if a secret is configured
-            signature = None
-            if Config.WEBHOOK_SECRET:
-                signature = hmac.new(
-                    Config.WEBHOOK_SECRET.encode(),
-                    json.dumps(payload).encode(),
-                    hashlib.sha256
-                ).hexdigest()
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'application/json'
-            }
-            
-            if signature:
-                headers['X-Webhook-Signature'] = signature
-            
-            # Send the webhook
-            response = requests.post(
-                request.webhook_url,
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
-            
-            response.raise_for_status()
-            
-            # Update webhook status
-            request.webhook_status = 'sent'
+        if request.webhook_status == 'not_sent':
+            enqueue_completion_webhook(request)
             db.session.commit()
-            
-        except requests.RequestException as e:
-            logger.error(f"Error sending webhook for request {request_id}: {str(e)}")
-            request.webhook_status = 'failed'
-            db.session.commit()
-            
-            # Retry with exponential backoff
-            retry_count = self.request.retries
-            backoff = 60 * (2 ** retry_count)  # 1 min, 2 min, 4 min
-            
-            raise self.retry(exc=e, countdown=backoff)
+        
+        schedule_webhook_flush()
+
+def enqueue_completion_webhook(request):
+    """
+    Adds the completion event for a request to the webhook outbox. No files are
+    touched here, so the entry can be committed together with the status change;
+    the results CSV is built when the entry is first flushed.
+    The caller is responsible for committing the session.
+    
+    Parameters:
+    request (Request): The completed request
+    
+    Returns:
+    WebhookDelivery: The new outbox entry, or None if the webhook was already queued
+    """
+    # Conditional update so two workers finishing the same request queue one webhook;
+    # the second blocks on the row until the first commits and then matches nothing
+    queued = Request.query.filter_by(
+        id=request.id,
+        webhook_status='not_sent'
+    ).update({'webhook_status': 'queued'}, synchronize_session='evaluate')
+    
+    if queued != 1:
+        logger.info(f"Webhook for request {request.id} already queued")
+        return None
+    
+    # Prepare webhook payload
+    payload = {
+        'request_id': request.id,
+        'status': request.status,
+        'total_images': request.total_images,
+        'processed_images': request.processed_images,
+        'completion_time': (request.updated_at or datetime.utcnow()).isoformat(),
+        'results_csv_url': results_csv_url(request.id)
+    }
+    
+    delivery = WebhookDelivery(
+        request_id=request.id,
+        webhook_url=request.webhook_url,
+        payload=json.dumps(payload),
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(delivery)
+    
+    return delivery
+
+def schedule_webhook_flush(countdown=None):
+    """
+    Schedules an outbox flush. The default countdown leaves a short window in which
+    completions for the same endpoint accumulate and are delivered as one batch.
+    Scheduling is best-effort: if the broker is unavailable the error is logged and
+    the entries are delivered by the periodic outbox sweep instead.
+    
+    Parameters:
+    countdown (int): Seconds to wait before flushing (defaults to WEBHOOK_BATCH_WINDOW)
+    """
+    if countdown is None:
+        countdown = Config.WEBHOOK_BATCH_WINDOW
+    
+    try:
+        flush_webhook_outbox.apply_async(countdown=countdown)
+    except Exception as e:
+        logger.error(f"Error scheduling webhook flush, leaving it to the outbox sweep: {str(e)}")
+
+@celery.task
+def flush_webhook_outbox():
+    """
+    Delivers all due outbox entries, coalescing entries for the same endpoint into batches.
+    """
+    with app_context():
+        deliveries = claim_due_deliveries()
+        
+        if not deliveries:
+            return
+        
+        # Build each request's results CSV once; later attempts reuse the file.
+        # A failed build is handled like a failed delivery and retried.
+        results = []
+        by_url = defaultdict(list)
+        for delivery in deliveries:
+            try:
+                ensure_results_csv(delivery.request_id)
+            except Exception as e:
+                results.append(([delivery], e))
+                continue
+            by_url[delivery.webhook_url].append(delivery)
+        
+        # Group by endpoint and split into batches
+        
+        batches = []
+        for webhook_url, entries in by_url.items():
+            for start in range(0, len(entries), Config.WEBHOOK_BATCH_SIZE):
+                batches.append((webhook_url, entries[start:start + Config.WEBHOOK_BATCH_SIZE]))
+        
+        # Send batches concurrently; database updates stay on this thread
+        with ThreadPoolExecutor(max_workers=Config.WEBHOOK_MAX_WORKERS) as executor:
+            futures = [
+                (entries, executor.submit(deliver_batch, webhook_url, [json.loads(d.payload) for d in entries]))
+                for webhook_url, entries in batches
+            ]
+            results.extend((entries, future.exception()) for entries, future in futures)
+        
+        retry_at = None
+        for entries, error in results:
+            for delivery in entries:
+                next_attempt = record_delivery_result(delivery, error)
+                if next_attempt and (retry_at is None or next_attempt < retry_at):
+                    retry_at = next_attempt
+        
+        db.session.commit()
+        
+        # Schedule a flush for the earliest pending retry
+        if retry_at:
+            schedule_webhook_flush(max(0, int((retry_at - datetime.utcnow()).total_seconds())))
+
+def claim_due_deliveries():
+    """
+    Atomically claims the outbox entries that are due for delivery.
+    Entries stuck in 'sending' longer than WEBHOOK_CLAIM_TIMEOUT are reclaimed.
+    
+    Returns:
+    list: The claimed WebhookDelivery entries
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=Config.WEBHOOK_CLAIM_TIMEOUT)
+    
+    due_filter = db.or_(
+        db.and_(WebhookDelivery.status == 'pending', WebhookDelivery.next_attempt_at <= now),
+        db.and_(WebhookDelivery.status == 'sending', WebhookDelivery.updated_at <= stale_before)
+    )
+    
+    candidate_ids = [
+        row.id for row in WebhookDelivery.query.with_entities(WebhookDelivery.id).filter(
+            due_filter
+        ).order_by(
+            WebhookDelivery.next_attempt_at
+        ).limit(Config.WEBHOOK_FLUSH_LIMIT).all()
+    ]
+    
+    if not candidate_ids:
+        return []
+    
+    # Conditional update so concurrent flushes never claim the same entry
+    claim_token = str(uuid.uuid4())
+    WebhookDelivery.query.filter(
+        WebhookDelivery.id.in_(candidate_ids),
+        due_filter
+    ).update({
+        'status': 'sending',
+        'claim_token': claim_token,
+        'updated_at': now
+    }, synchronize_session=False)
+    db.session.commit()
+    
+    return WebhookDelivery.query.filter_by(claim_token=claim_token, status='sending').all()
+
+def deliver_batch(webhook_url, events, session=None):
+    """
+    Sends one or more completion events to a webhook endpoint.
+    A single event is sent as-is; several events are sent as {"events": [...]}.
+    
+    Parameters:
+    webhook_url (str): The webhook URL
+    events (list): The event payloads to deliver
+    session (requests.Session): Session to send with (defaults to the pooled session)
+    
+    Raises:
+    requests.RequestException: If the delivery fails
+    """
+    if session is None:
+        session = get_http_session()
+    
+    payload = events[0] if len(events) == 1 else {'events': events}
+    body = json.dumps(payload).encode()
+    
+    # Prepare headers
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    
+    # Sign the payload if a secret is configured
+    if Config.WEBHOOK_SECRET:
+        headers['X-Webhook-Signature'] = hmac.new(
+            Config.WEBHOOK_SECRET.encode(),
+            body,
+            hashlib.sha256
+        ).hexdigest()
+    
+    # Send the webhook, holding one of the endpoint's concurrency slots
+    with _endpoint_slot(webhook_url):
+        response = session.post(
+            webhook_url,
+            headers=headers,
+            data=body,
+            timeout=Config.WEBHOOK_TIMEOUT
+        )
+    
+    response.raise_for_status()
+
+def record_delivery_result(delivery, error):
+    """
+    Updates an outbox entry and its request after a delivery attempt.
+    
+    Parameters:
+    delivery (WebhookDelivery): The outbox entry
+    error (Exception): The delivery error, or None on success
+    
+    Returns:
+    datetime: When the entry should be retried, or None if it is finished
+    """
+    delivery.attempts = (delivery.attempts or 0) + 1
+    delivery.claim_token = None
+    
+    if error is None:
+        delivery.status = 'sent'
+        delivery.sent_at = datetime.utcnow()
+        delivery.last_error = None
+        delivery.request.webhook_status = 'sent'
+        return None
+    
+    logger.error(f"Error sending webhook for request {delivery.request_id}: {str(error)}")
+    delivery.last_error = str(error)[:1024]
+    
+    # Only give up once all attempts are exhausted
+    if delivery.attempts >= Config.WEBHOOK_MAX_ATTEMPTS:
+        delivery.status = 'failed'
+        delivery.request.webhook_status = 'failed'
+        return None
+    
+    # Retry with exponential backoff
+    backoff = 60 * (2 ** (delivery.attempts - 1))  # 1 min, 2 min, 4 min
+    delivery.status = 'pending'
+    delivery.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff)
+    
+    return delivery.next_attempt_at
+
+def results_csv_url(request_id):
+    """
+    Returns the URL the results CSV of a request is served at.
+    
+    Parameters:
+    request_id (str): The ID of the request
+    
+    Returns:
+    str: URL to the results CSV file
+    """
+    return f"{Config.BASE_URL}/results/{request_id}_results.csv"
+
+def ensure_results_csv(request_id):
+    """
+    Returns the URL of the results CSV, generating the file only if it does not exist yet.
+    
+    Parameters:
+    request_id (str): The ID of the request
+    
+    Returns:
+    str: URL to the results CSV file
+    """
+    filename = f"{request_id}_results.csv"
+    
+    if not os.path.exists(os.path.join(Config.RESULTS_FOLDER, filename)):
+        return generate_results_csv(request_id)
+    
+    return results_csv_url(request_id)
 
 def generate_results_csv(request_id):
     """
@@ -102,7 +364,6 @@ def generate_results_csv(request_id):
     str: URL to the generated CSV file
     """
     import pandas as pd
-    import os
     
     # Get all products and images for this request
     products = Product.query.filter_by(request_id=request_id).order_by(Product.serial_number).all()
@@ -134,8 +395,9 @@ def generate_results_csv(request_id):
     filename = f"{request_id}_results.csv"
     filepath = os.path.join(Config.RESULTS_FOLDER, filename)
     
-    # Save to CSV
-    df.to_csv(filepath, index=False)
+    # Save to CSV, replacing the file in one step so a failed write never leaves a partial file behind
+    df.to_csv(f"{filepath}.tmp", index=False)
+    os.replace(f"{filepath}.tmp", filepath)
     
     # Return URL to the CSV
     return f"{Config.BASE_URL}/results/{filename}"
\ No newline at end of file
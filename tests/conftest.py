@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import BytesIO
+import pytest
+
+# Point the app at throwaway storage before config is imported
+_workdir = tempfile.mkdtemp(prefix='image_processing_tests_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault('PROCESSED_FOLDER', os.path.join(_workdir, 'processed'))
+os.environ.setdefault('RESULTS_FOLDER', os.path.join(_workdir, 'results'))
+
+# Make the top-level modules (config, runtime, services, ...) importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def database():
+    """
+    Creates the tables for a test and drops them afterwards.
+    """
+    from runtime import app_context
+    from database.models import db
+    
+    with app_context():
+        db.create_all()
+    
+    yield db
+    
+    with app_context():
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def make_request(database):
+    """
+    Creates a request with one product and images with the given input URLs.
+    """
+    from runtime import app_context
+    from database.models import Request, Product, Image
+    
+    def make(request_id, urls, status='pending'):
+        with app_context():
+            database.session.add(Request(id=request_id, status='processing', total_images=len(urls)))
+            product = Product(request_id=request_id, serial_number=1, product_name='SKU1')
+            database.session.add(product)
+            database.session.flush()
+            
+            images = [Image(product_id=product.id, input_url=url, status=status) for url in urls]
+            database.session.add_all(images)
+            database.session.commit()
+            
+            return [image.id for image in images]
+    
+    return make
+
+@pytest.fixture
+def image_server():
+    """
+    Serves a JPEG for any path under /images and 404 for anything else.
+    """
+    from PIL import Image as PILImage
+    
+    output = BytesIO()
+    PILImage.effect_noise((200, 150), 40).convert('RGB').save(output, format='JPEG', quality=90)
+    body = output.getvalue()
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if not self.path.startswith('/images'):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    
+    server.shutdown()
@@ -0,0 +1,122 @@
+from io import BytesIO
+import pytest
+from PIL import Image as PILImage
+from services.compression_precheck import (
+    MIN_TABLE_SCALE, estimate_table_scale, precheck_recompression, quality_to_scale, scale_to_quality
+)
+from services.image_processor import compress_image_bytes
+
+def encode(quality, format='JPEG'):
+    """
+    Encodes a noisy image, which re-encoding cannot shrink much below its source quality.
+    """
+    img = PILImage.effect_noise((320, 240), 40).convert('RGB')
+    output = BytesIO()
+    
+    if format == 'MPO':
+        img.save(output, format='MPO', save_all=True, append_images=[img.rotate(90)], quality=quality)
+    else:
+        img.save(output, format=format, quality=quality)
+    
+    return output.getvalue()
+
+def open_image(content):
+    return PILImage.open(BytesIO(content))
+
+@pytest.mark.parametrize('quality, scale', [(1, 5000), (25, 200), (50, 100), (75, 50), (90, 20), (100, 0)])
+def test_quality_to_scale(quality, scale):
+    assert quality_to_scale(quality) == scale
+    assert scale_to_quality(scale) == quality
+
+def test_quality_to_scale_clamps_out_of_range_qualities():
+    assert quality_to_scale(0) == quality_to_scale(1)
+    assert quality_to_scale(150) == quality_to_scale(100)
+    assert scale_to_quality(10000) == 1
+
+@pytest.mark.parametrize('quality', [30, 60, 90])
+def test_estimate_table_scale_recovers_quality(quality):
+    assert scale_to_quality(estimate_table_scale(open_image(encode(quality)))) == quality
+
+@pytest.mark.parametrize('format', ['PNG', 'GIF'])
+def test_estimate_table_scale_ignores_non_jpeg(format):
+    assert estimate_table_scale(open_image(encode(90, format))) is None
+
+def test_precheck_estimates_savings():
+    precheck = precheck_recompression(open_image(encode(90)), 50, 10)
+    
+    # (20 / 100) ** 0.55 of the size is left
+    assert precheck['recompress']
+    assert precheck['source_quality'] == 90
+    assert precheck['estimated_savings'] == pytest.approx(58.8, abs=0.5)
+
+def test_precheck_skips_sources_at_or_below_target_quality():
+    for quality in (30, 50):
+        precheck = precheck_recompression(open_image(encode(quality)), 50, 10)
+        
+        assert not precheck['recompress']
+        assert precheck['estimated_savings'] <= 0
+
+def test_precheck_target_quality_100_uses_min_table_scale():
+    # Quality 100 scales the tables to 0, but every entry is clamped to 1
+    precheck = precheck_recompression(open_image(encode(100)), 100, 10)
+    
+    assert MIN_TABLE_SCALE > 0
+    assert precheck['estimated_savings'] == pytest.approx(0, abs=1)
+    assert not precheck['recompress']
+
+def test_precheck_recompresses_non_jpeg():
+    precheck = precheck_recompression(open_image(encode(90, 'PNG')), 50, 10)
+    
+    assert precheck == {'recompress': True, 'source_quality': None, 'estimated_savings': None}
+
+def test_compress_recompresses_high_quality_jpeg():
+    content = encode(90)
+    
+    result = compress_image_bytes(content, quality=50, min_savings=10)
+    
+    assert result['decision'] == 'recompressed'
+    assert result['source_quality'] == 90
+    assert result['extension'] == 'jpeg'
+    assert len(result['data']) < len(content) * 0.9
+    assert scale_to_quality(estimate_table_scale(open_image(result['data']))) == 50
+
+def test_compress_skips_low_quality_jpeg():
+    content = encode(30)
+    
+    result = compress_image_bytes(content, quality=50, min_savings=10)
+    
+    assert result['decision'] == 'skipped'
+    assert result['source_quality'] == 30
+    assert result['data'] is content
+
+def test_compress_keeps_original_when_reencoding_saves_too_little():
+    # The tables promise about 11% savings, but noise re-encoded at 50 is only about 3% smaller
+    content = encode(60)
+    
+    result = compress_image_bytes(content, quality=50, min_savings=10)
+    
+    assert result['decision'] == 'passthrough'
+    assert result['source_quality'] == 60
+    assert result['data'] is content
+
+def test_compress_treats_mpo_as_jpeg():
+    content = encode(90, 'MPO')
+    assert open_image(content).format == 'MPO'
+    
+    result = compress_image_bytes(content, quality=50, min_savings=10)
+    
+    assert result['decision'] == 'recompressed'
+    assert result['source_quality'] == 90
+    assert result['extension'] == 'jpeg'
+    assert open_image(result['data']).format == 'JPEG'
+
+@pytest.mark.parametrize('format', ['PNG', 'GIF'])
+def test_compress_non_jpeg(format):
+    content = encode(90, format)
+    
+    result = compress_image_bytes(content, quality=50, min_savings=10)
+    
+    # Lossless re-encoding with the same encoder does not shrink the file
+    assert result['decision'] == 'passthrough'
+    assert result['source_quality'] is None
+    assert result['extension'] == format.lower()
@@ -0,0 +1,46 @@
+from database.models import Request, Image
+from runtime import app_context
+from services.image_processor import process_image, check_request_completion
+
+def test_process_image_marks_failed_download(make_request):
+    image_ids = make_request('r1', ['http://127.0.0.1:1/a.jpg', 'http://127.0.0.1:1/b.jpg'])
+    
+    process_image(image_ids[0])
+    
+    with app_context():
+        assert Image.query.get(image_ids[0]).status == 'failed'
+        assert Image.query.get(image_ids[1]).status == 'pending'
+        
+        request = Request.query.get('r1')
+        assert request.status == 'processing'
+        assert request.processed_images == 1
+
+def test_process_image_records_compression_decision(make_request, image_server):
+    image_ids = make_request('r1', [f"{image_server}/images/a.jpg"])
+    
+    process_image(image_ids[0])
+    
+    with app_context():
+        image = Image.query.get(image_ids[0])
+        assert image.status == 'completed'
+        assert image.source_quality == 90
+        assert image.compression_decision == 'recompressed'
+        assert image.output_url.endswith('.jpeg')
+
+def test_check_request_completion_keeps_the_callers_session(make_request, database):
+    image_ids = make_request('r1', ['http://example.com/a.jpg'])
+    
+    with app_context():
+        image = Image.query.get(image_ids[0])
+        image.status = 'completed'
+        database.session.commit()
+        
+        check_request_completion('r1')
+        
+        # The caller's objects stay attached and further changes are persisted
+        image.output_url = 'http://localhost:5000/processed/a.jpg'
+        database.session.commit()
+    
+    with app_context():
+        assert Image.query.get(image_ids[0]).output_url == 'http://localhost:5000/processed/a.jpg'
+        assert Request.query.get('r1').status == 'completed'
@@ -0,0 +1,177 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from config import Config
+from database.models import Request, Image
+from runtime import app_context
+from services import pipeline
+
+@pytest.fixture(autouse=True)
+def encode_pool(monkeypatch):
+    """
+    Uses a single encoder and shuts down any pool a test created.
+    """
+    monkeypatch.setattr(Config, 'PIPELINE_ENCODE_PROCESSES', 1)
+    monkeypatch.setattr(pipeline, '_encode_pool', None)
+    
+    yield
+    
+    if pipeline._encode_pool is not None:
+        pipeline._encode_pool.shutdown()
+
+def statuses(image_ids):
+    with app_context():
+        return [Image.query.get(image_id).status for image_id in image_ids]
+
+def test_run_pipeline_processes_images(make_request, image_server):
+    image_ids = make_request('r1', [f"{image_server}/images/{i}.jpg" for i in range(3)] + [f"{image_server}/missing.jpg"])
+    
+    stats = pipeline.run_pipeline(image_ids)
+    
+    assert stats['images'] == 4
+    assert stats['failed'] == 1
+    assert statuses(image_ids) == ['completed', 'completed', 'completed', 'failed']
+    
+    with app_context():
+        assert Request.query.get('r1').status == 'completed'
+        assert all(Image.query.get(image_id).output_url for image_id in image_ids[:3])
+
+def _run_pipeline_in_child(image_ids):
+    pipeline._encode_pool = None
+    pipeline.run_pipeline(image_ids)
+
+def test_run_pipeline_in_daemonic_process(make_request, image_server):
+    image_ids = make_request('r1', [f"{image_server}/images/{i}.jpg" for i in range(4)])
+    
+    # Celery's prefork pool runs tasks in daemonic children, which cannot start a process pool
+    child = multiprocessing.get_context('fork').Process(target=_run_pipeline_in_child, args=(image_ids,), daemon=True)
+    child.start()
+    child.join(60)
+    
+    assert child.exitcode == 0
+    assert statuses(image_ids) == ['completed'] * 4
+
+class BrokenPool:
+    """
+    Executor whose pool broke, like a process pool after an encoder was OOM-killed.
+    """
+    def __init__(self):
+        self.shut_down = False
+    
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool('A child process terminated abruptly'))
+        return future
+    
+    def shutdown(self, wait=True, **kwargs):
+        self.shut_down = True
+
+def test_run_pipeline_replaces_broken_encode_pool(make_request, image_server, monkeypatch):
+    image_ids = make_request('r1', [f"{image_server}/images/{i}.jpg" for i in range(2)])
+    broken = BrokenPool()
+    
+    # Run the first get_encode_pool call (before claiming) against the broken pool too
+    monkeypatch.setattr(pipeline, '_encode_pool', broken)
+    
+    pipeline.run_pipeline(image_ids)
+    
+    assert broken.shut_down
+    assert pipeline._encode_pool is not broken
+    assert statuses(image_ids) == ['completed', 'completed']
+
+def test_run_pipeline_commits_in_batches_off_the_loop_thread(make_request, image_server, monkeypatch):
+    image_ids = make_request('r1', [f"{image_server}/images/{i}.jpg" for i in range(7)])
+    monkeypatch.setattr(Config, 'PIPELINE_COMMIT_BATCH', 3)
+    monkeypatch.setattr(Config, 'PIPELINE_COMMIT_INTERVAL', 60)
+    
+    commits = []
+    commit_batch = pipeline.commit_batch
+    
+    def record_commit(batch):
+        commits.append((len(batch), threading.current_thread()))
+        commit_batch(batch)
+    
+    monkeypatch.setattr(pipeline, 'commit_batch', record_commit)
+    
+    pipeline.run_pipeline(image_ids)
+    
+    assert [size for size, _ in commits] == [3, 3, 1]
+    assert all(thread is not threading.main_thread() for _, thread in commits)
+    assert statuses(image_ids) == ['completed'] * 7
+
+def test_run_pipeline_fails_uncommitted_images_on_error(make_request, image_server, monkeypatch):
+    image_ids = make_request('r1', [f"{image_server}/images/{i}.jpg" for i in range(4)])
+    monkeypatch.setattr(Config, 'PIPELINE_COMMIT_BATCH', 2)
+    monkeypatch.setattr(Config, 'PIPELINE_COMMIT_INTERVAL', 60)
+    
+    commit_batch = pipeline.commit_batch
+    commits = []
+    
+    def commit_once(batch):
+        if commits:
+            raise RuntimeError('database went away')
+        commits.append(batch)
+        commit_batch(batch)
+    
+    monkeypatch.setattr(pipeline, 'commit_batch', commit_once)
+    
+    with pytest.raises(RuntimeError):
+        pipeline.run_pipeline(image_ids)
+    
+    assert sorted(statuses(image_ids)) == ['completed', 'completed', 'failed', 'failed']
+    
+    with app_context():
+        assert Request.query.get('r1').status == 'completed'
+
+def test_concurrent_claims_never_return_the_same_image(make_request):
+    image_ids = make_request('r1', [f"http://example.com/{i}.jpg" for i in range(20)])
+    barrier = threading.Barrier(2)
+    claims = []
+    
+    def claim():
+        with app_context():
+            barrier.wait()
+            claims.append([image['id'] for image in pipeline.claim_images(image_ids)])
+    
+    threads = [threading.Thread(target=claim) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    
+    assert len(claims) == 2
+    assert not set(claims[0]) & set(claims[1])
+    assert set(claims[0]) | set(claims[1]) == set(image_ids)
+
+def test_claim_images_skips_images_claimed_elsewhere(make_request):
+    image_ids = make_request('r1', [f"http://example.com/{i}.jpg" for i in range(3)])
+    
+    with app_context():
+        first = pipeline.claim_images(image_ids[:2])
+        second = pipeline.claim_images(image_ids)
+    
+    assert sorted(image['id'] for image in first) == sorted(image_ids[:2])
+    assert [image['id'] for image in second] == [image_ids[2]]
+
+def test_commit_batches_do_not_hold_image_data(make_request, image_server, monkeypatch):
+    image_ids = make_request('r1', [f"{image_server}/images/{i}.jpg" for i in range(3)])
+    
+    batches = []
+    commit_batch = pipeline.commit_batch
+    
+    def record_commit(batch):
+        batches.append(batch)
+        commit_batch(batch)
+    
+    monkeypatch.setattr(pipeline, 'commit_batch', record_commit)
+    
+    pipeline.run_pipeline(image_ids)
+    
+    entries = [entry for batch in batches for entry in batch]
+    assert len(entries) == 3
+    assert not any(isinstance(value, (bytes, dict)) for _, *values in entries for value in values)
+    
+    with app_context():
+        assert all(Image.query.get(image_id).source_quality == 90 for image_id in image_ids)
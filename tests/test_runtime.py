@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import runtime
+from config import Config
+from runtime import get_engine_options, get_app, get_redis, reset_connections
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_engine_options_size_the_pool_for_server_databases():
+    assert get_engine_options('postgresql://user:pass@db/app') == {
+        'pool_size': Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_recycle': Config.DB_POOL_RECYCLE,
+        'pool_pre_ping': True
+    }
+
+def test_engine_options_keep_sqlite_defaults():
+    assert get_engine_options('sqlite:///app.db') == {}
+
+def test_app_is_created_once():
+    app = get_app()
+    
+    assert get_app() is app
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == get_engine_options(Config.SQLALCHEMY_DATABASE_URI)
+
+def test_app_is_rooted_at_the_repo_from_any_directory(tmp_path):
+    code = f"import sys; sys.path.insert(0, {REPO_ROOT!r}); import runtime; print(runtime.get_app().root_path)"
+    
+    output = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, capture_output=True, text=True, check=True)
+    
+    assert output.stdout.strip() == REPO_ROOT
+
+def test_redis_client_is_created_once_with_a_blocking_pool(monkeypatch):
+    monkeypatch.setattr(runtime, '_redis', None)
+    
+    client = get_redis()
+    pool = client.connection_pool
+    
+    assert get_redis() is client
+    assert pool.max_connections == Config.REDIS_MAX_CONNECTIONS
+    assert pool.timeout == Config.REDIS_POOL_TIMEOUT
+
+def test_reset_connections_drops_inherited_connections(monkeypatch):
+    from database.models import db
+    
+    monkeypatch.setattr(runtime, '_redis', None)
+    inherited = get_redis()
+    
+    with get_app().app_context():
+        engine = db.engine
+        disposed = []
+        monkeypatch.setattr(engine, 'dispose', lambda *args, **kwargs: disposed.append(True))
+    
+    reset_connections()
+    
+    assert disposed == [True]
+    assert get_redis() is not inherited
+
+def test_task_modules_import_without_heavy_dependencies():
+    code = (
+        "import sys\n"
+        "import services.image_processor, services.webhook_service\n"
+        "print(','.join(m for m in ('pandas', 'PIL', 'requests', 'redis', 'flask') if m in sys.modules))"
+    )
+    
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    
+    # Flask is needed for the models; pandas, Pillow, requests and Redis are imported on first use
+    assert output.stdout.strip() == 'flask'
@@ -0,0 +1,290 @@
+import hashlib
+import hmac
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from werkzeug.serving import make_server
+import webhook_receiver
+from config import Config
+from database.models import Request, WebhookDelivery, db
+from runtime import app_context
+from services import image_processor, webhook_service
+from services.image_processor import check_request_completion
+from services.webhook_service import claim_due_deliveries, deliver_batch, enqueue_completion_webhook, flush_webhook_outbox
+
+_schedule_webhook_flush = webhook_service.schedule_webhook_flush
+
+@pytest.fixture
+def receiver(monkeypatch):
+    """
+    Runs the local webhook receiver stub and returns its webhook URL.
+    """
+    monkeypatch.setattr(webhook_receiver, 'FAIL_FIRST', 0)
+    monkeypatch.setattr(webhook_receiver, 'WEBHOOK_SECRET', '')
+    monkeypatch.setattr(webhook_receiver, '_attempts', 0)
+    monkeypatch.setattr(webhook_receiver, '_received', [])
+    
+    server = make_server('127.0.0.1', 0, webhook_receiver.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    yield f"http://127.0.0.1:{server.port}/webhook"
+    
+    server.shutdown()
+
+@pytest.fixture(autouse=True)
+def scheduled(monkeypatch):
+    """
+    Records scheduled flushes instead of publishing them to the broker.
+    """
+    countdowns = []
+    
+    def schedule(countdown=None):
+        countdowns.append(countdown)
+    
+    monkeypatch.setattr(webhook_service, 'schedule_webhook_flush', schedule)
+    monkeypatch.setattr(image_processor, 'schedule_webhook_flush', schedule)
+    
+    return countdowns
+
+def complete_request(make_request, webhook_url):
+    """
+    Creates a request whose only image is done and lets it complete, queueing its webhook.
+    """
+    request_id = str(uuid.uuid4())
+    make_request(request_id, ['http://example.com/a.jpg'], status='completed')
+    
+    with app_context():
+        request = Request.query.get(request_id)
+        request.webhook_url = webhook_url
+        request.webhook_status = 'not_sent'
+        db.session.commit()
+        
+        check_request_completion(request_id)
+    
+    return request_id
+
+def make_due():
+    with app_context():
+        WebhookDelivery.query.update({'next_attempt_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+def delivery_for(request_id):
+    with app_context():
+        delivery = WebhookDelivery.query.filter_by(request_id=request_id).one()
+        db.session.expunge(delivery)
+        return delivery
+
+def webhook_status(request_id):
+    with app_context():
+        return Request.query.get(request_id).webhook_status
+
+def test_flush_batches_events_for_one_endpoint(make_request, receiver, scheduled):
+    request_ids = [complete_request(make_request, receiver) for _ in range(3)]
+    
+    assert len(scheduled) == 3
+    
+    flush_webhook_outbox()
+    
+    assert webhook_receiver._attempts == 1
+    assert len(webhook_receiver._received) == 1
+    assert sorted(event['request_id'] for event in webhook_receiver._received[0]['events']) == sorted(request_ids)
+    assert all(delivery_for(request_id).status == 'sent' for request_id in request_ids)
+    assert all(webhook_status(request_id) == 'sent' for request_id in request_ids)
+
+def test_deliver_batch_sends_multiple_events_as_one_post(monkeypatch):
+    sent = []
+    
+    class Session:
+        def post(self, url, headers, data, timeout):
+            sent.append(json.loads(data))
+            return type('Response', (), {'raise_for_status': lambda self: None})()
+    
+    deliver_batch('http://example.com/webhook', [{'request_id': 'a'}, {'request_id': 'b'}], session=Session())
+    deliver_batch('http://example.com/webhook', [{'request_id': 'c'}], session=Session())
+    
+    assert sent == [{'events': [{'request_id': 'a'}, {'request_id': 'b'}]}, {'request_id': 'c'}]
+
+def test_signature_is_computed_over_the_raw_body(make_request, receiver, monkeypatch):
+    monkeypatch.setattr(Config, 'WEBHOOK_SECRET', 's3cret')
+    monkeypatch.setattr(webhook_receiver, 'WEBHOOK_SECRET', 's3cret')
+    request_id = complete_request(make_request, receiver)
+    
+    bodies = []
+    post = webhook_service.get_http_session().post
+    
+    def record_post(url, headers, data, timeout):
+        bodies.append((headers['X-Webhook-Signature'], data))
+        return post(url, headers=headers, data=data, timeout=timeout)
+    
+    monkeypatch.setattr(webhook_service.get_http_session(), 'post', record_post)
+    
+    flush_webhook_outbox()
+    
+    signature, body = bodies[0]
+    assert signature == hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+    assert delivery_for(request_id).status == 'sent'
+
+def test_signature_mismatch_is_a_failed_attempt(make_request, receiver, monkeypatch):
+    monkeypatch.setattr(Config, 'WEBHOOK_SECRET', 's3cret')
+    monkeypatch.setattr(webhook_receiver, 'WEBHOOK_SECRET', 'other')
+    request_id = complete_request(make_request, receiver)
+    
+    flush_webhook_outbox()
+    
+    assert delivery_for(request_id).status == 'pending'
+    assert webhook_receiver._received == []
+
+def test_failed_delivery_is_retried_with_backoff(make_request, receiver, scheduled, monkeypatch):
+    monkeypatch.setattr(webhook_receiver, 'FAIL_FIRST', 1)
+    request_id = complete_request(make_request, receiver)
+    
+    before = datetime.utcnow()
+    flush_webhook_outbox()
+    
+    delivery = delivery_for(request_id)
+    assert delivery.status == 'pending'
+    assert delivery.attempts == 1
+    assert delivery.claim_token is None
+    assert '503' in delivery.last_error
+    assert before + timedelta(seconds=60) <= delivery.next_attempt_at <= datetime.utcnow() + timedelta(seconds=60)
+    assert webhook_status(request_id) == 'queued'
+    assert 55 <= scheduled[-1] <= 60
+    
+    make_due()
+    flush_webhook_outbox()
+    
+    delivery = delivery_for(request_id)
+    assert delivery.status == 'sent'
+    assert delivery.attempts == 2
+    assert webhook_status(request_id) == 'sent'
+
+def test_delivery_fails_after_max_attempts(make_request, receiver, monkeypatch):
+    monkeypatch.setattr(Config, 'WEBHOOK_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(webhook_receiver, 'FAIL_FIRST', 10)
+    request_id = complete_request(make_request, receiver)
+    
+    flush_webhook_outbox()
+    assert delivery_for(request_id).status == 'pending'
+    
+    make_due()
+    flush_webhook_outbox()
+    
+    delivery = delivery_for(request_id)
+    assert delivery.status == 'failed'
+    assert delivery.attempts == 2
+    assert webhook_status(request_id) == 'failed'
+    
+    # Failed entries are never claimed again
+    make_due()
+    flush_webhook_outbox()
+    assert webhook_receiver._attempts == 2
+
+def test_results_csv_is_built_once_and_reused_on_retry(make_request, receiver, monkeypatch):
+    monkeypatch.setattr(webhook_receiver, 'FAIL_FIRST', 1)
+    request_id = complete_request(make_request, receiver)
+    
+    builds = []
+    generate_results_csv = webhook_service.generate_results_csv
+    
+    def record_build(request_id):
+        builds.append(request_id)
+        return generate_results_csv(request_id)
+    
+    monkeypatch.setattr(webhook_service, 'generate_results_csv', record_build)
+    
+    flush_webhook_outbox()
+    make_due()
+    flush_webhook_outbox()
+    
+    assert builds == [request_id]
+    assert delivery_for(request_id).status == 'sent'
+    assert webhook_receiver._received[0]['events'][0]['results_csv_url'].endswith(f"/results/{request_id}_results.csv")
+
+def test_completing_a_request_twice_queues_one_webhook(make_request):
+    request_id = str(uuid.uuid4())
+    make_request(request_id, ['http://example.com/a.jpg'], status='completed')
+    
+    with app_context():
+        request = Request.query.get(request_id)
+        request.webhook_url = 'http://example.com/webhook'
+        request.webhook_status = 'not_sent'
+        db.session.commit()
+        
+        # Another worker completes the request after this one read it
+        request = Request.query.get(request_id)
+        assert request.webhook_status == 'not_sent'
+        worker = threading.Thread(target=check_request_completion, args=(request_id,))
+        worker.start()
+        worker.join(30)
+        
+        assert enqueue_completion_webhook(request) is None
+        db.session.commit()
+        
+        assert WebhookDelivery.query.filter_by(request_id=request_id).count() == 1
+        assert Request.query.get(request_id).webhook_status == 'queued'
+
+def test_completion_survives_an_unavailable_broker(make_request, monkeypatch):
+    monkeypatch.setattr(image_processor, 'schedule_webhook_flush', _schedule_webhook_flush)
+    
+    def apply_async(**kwargs):
+        raise ConnectionError('broker unavailable')
+    
+    monkeypatch.setattr(webhook_service.flush_webhook_outbox, 'apply_async', apply_async)
+    
+    request_id = complete_request(make_request, 'http://example.com/webhook')
+    
+    with app_context():
+        assert Request.query.get(request_id).status == 'completed'
+    assert delivery_for(request_id).status == 'pending'
+    assert webhook_status(request_id) == 'queued'
+
+def add_delivery(status, updated_at=None):
+    request_id = str(uuid.uuid4())
+    
+    with app_context():
+        db.session.add(Request(id=request_id, status='completed', webhook_url='http://example.com/webhook', webhook_status='queued'))
+        delivery = WebhookDelivery(
+            request_id=request_id,
+            webhook_url='http://example.com/webhook',
+            payload=json.dumps({'request_id': request_id}),
+            status=status,
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+            updated_at=updated_at or datetime.utcnow()
+        )
+        db.session.add(delivery)
+        db.session.commit()
+        
+        return delivery.id
+
+def test_stale_sending_entry_is_claimed_again(database):
+    stale = add_delivery('sending', datetime.utcnow() - timedelta(seconds=Config.WEBHOOK_CLAIM_TIMEOUT + 1))
+    add_delivery('sending')
+    
+    with app_context():
+        claimed = claim_due_deliveries()
+        
+        assert [delivery.id for delivery in claimed] == [stale]
+        assert claimed[0].claim_token is not None
+
+def test_concurrent_claims_never_return_the_same_entry(database):
+    delivery_ids = {add_delivery('pending') for _ in range(20)}
+    barrier = threading.Barrier(2)
+    claims = []
+    
+    def claim():
+        with app_context():
+            barrier.wait()
+            claims.append([delivery.id for delivery in claim_due_deliveries()])
+    
+    threads = [threading.Thread(target=claim) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    
+    assert len(claims) == 2
+    assert not set(claims[0]) & set(claims[1])
+    assert set(claims[0]) | set(claims[1]) == delivery_ids
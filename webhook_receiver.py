@@ -0,0 +1,71 @@
+from flask import Flask, request, jsonify
+import hmac
+import hashlib
+import os
+import threading
+
+# Local webhook receiver stub for exercising webhook delivery end to end.
+#
+#   python webhook_receiver.py
+#   WEBHOOK_URL=http://localhost:5001/webhook
+#
+# RECEIVER_FAIL_FIRST=N makes the first N deliveries return 503 to exercise retries.
+
+app = Flask(__name__)
+
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+FAIL_FIRST = int(os.environ.get('RECEIVER_FAIL_FIRST', 0))
+
+_received = []
+_attempts = 0
+_lock = threading.Lock()
+
+@app.route('/webhook', methods=['POST'])
+def receive_webhook():
+    """
+    Accepts a single event or a batch of events and records them.
+    """
+    global _attempts
+    
+    with _lock:
+        _attempts += 1
+        if _attempts <= FAIL_FIRST:
+            return jsonify({'error': 'Simulated failure'}), 503
+    
+    # Verify the signature if a secret is configured
+    if WEBHOOK_SECRET:
+        expected = hmac.new(WEBHOOK_SECRET.encode(), request.get_data(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, request.headers.get('X-Webhook-Signature', '')):
+            return jsonify({'error': 'Invalid signature'}), 401
+    
+    payload = request.get_json()
+    events = payload['events'] if 'events' in payload else [payload]
+    
+    with _lock:
+        _received.append({'batch_size': len(events), 'events': events})
+    
+    return jsonify({'received': len(events)}), 200
+
+@app.route('/received', methods=['GET'])
+def list_received():
+    """
+    Returns every batch received so far along with the number of delivery attempts.
+    """
+    with _lock:
+        return jsonify({'attempts': _attempts, 'batches': _received}), 200
+
+@app.route('/received', methods=['DELETE'])
+def reset_received():
+    """
+    Clears the recorded batches and attempt counter.
+    """
+    global _attempts
+    
+    with _lock:
+        _received.clear()
+        _attempts = 0
+    
+    return '', 204
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=int(os.environ.get('RECEIVER_PORT', 5001)))
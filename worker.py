@@ -1,20 +1,10 @@
-import redis
-from rq import Worker, Queue, Connection
-from config import Config
+from runtime import get_redis
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Connect to Redis
-redis_conn = redis.Redis(
-    host=Config.REDIS_HOST,
-    port=Config.REDIS_PORT,
-    password=Config.REDIS_PASSWORD,
-    db=Config.REDIS_DB
-)
-
 # Define the function that will be executed by the worker
 def process_image(image_id):
     """
@@ -28,7 +18,9 @@ def process_image(image_id):
     celery_process_image(image_id)
 
 if __name__ == '__main__':
+    from rq import Worker, Queue, Connection
+    
     # Start the worker
-    with Connection(redis_conn):
+    with Connection(get_redis()):
         worker = Worker(Queue('default'))
         worker.work()
\ No newline at end of file